@@ -6,8 +6,14 @@ import yfinance as yf
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import io
+import html
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+from indicadores import numba, compute_all_indicators, calcular_indicadores_pandas
+
 # --- Configuración de página ---
 st.set_page_config(
     page_title="Analizador de Acciones Pro",
@@ -33,63 +39,137 @@ st.markdown("""
 
 # --- Funciones auxiliares ---
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=8))
-def safe_download(ticker, start_date, end_date):
-    data = yf.download(ticker, start=start_date, end=end_date, progress=False)
+def _safe_download_uncached(ticker, start_date, end_date):
+    # Con auto_adjust=True la columna "Close" ya viene ajustada
+    data = yf.download(ticker, start=start_date, end=end_date, progress=False,
+                       auto_adjust=True, actions=False, threads=True)
     if data.empty:
         raise ValueError("No se encontraron datos.")
     return data
 
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def _safe_download_cached(ticker, start_iso, end_iso):
+    return _safe_download_uncached(ticker, start_iso, end_iso)
+
+def safe_download(ticker, start_date, end_date):
+    # Solo primitivas hashables como clave de caché (fechas en ISO, sin hora).
+    # yfinance trata `end` como exclusivo: se pide hasta el día siguiente
+    # para incluir la barra de hoy
+    start_iso = pd.Timestamp(start_date).date().isoformat()
+    end_iso = (pd.Timestamp(end_date).date() + timedelta(days=1)).isoformat()
+    return _safe_download_cached(ticker, start_iso, end_iso)
+
 def calcular_indicadores(data, indicadores):
+    # Clave barata en lugar de hashear todo el DataFrame: rango de fechas,
+    # longitud, precios extremos e indicadores activos
+    clave = (
+        data.index[0], data.index[-1], len(data),
+        data["Precio"].iat[0], data["Precio"].iat[-1],
+        tuple(sorted(indicadores.items())),
+    )
+    return _calcular_indicadores_cached(clave, data, indicadores)
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def _calcular_indicadores_cached(clave, _data, _indicadores):
+    data = _data.copy()
+    indicadores = _indicadores
+    if numba is None:
+        return calcular_indicadores_pandas(data, indicadores)
+
+    prices = data["Precio"].to_numpy(dtype=np.float64)
+    sma50, sma200, rsi, macd, signal = compute_all_indicators(prices)
     if indicadores.get("sma"):
-        data["SMA50"] = data["Precio"].rolling(50).mean()
-        data["SMA200"] = data["Precio"].rolling(200).mean()
+        data["SMA50"] = sma50
+        data["SMA200"] = sma200
     if indicadores.get("rsi"):
-        delta = data["Precio"].diff()
-        gain = delta.where(delta > 0, 0.0)
-        loss = -delta.where(delta < 0, 0.0)
-        avg_gain = gain.rolling(14).mean()
-        avg_loss = loss.rolling(14).mean()
-        rs = avg_gain / avg_loss
-        data["RSI"] = 100 - (100 / (1 + rs))
+        data["RSI"] = rsi
     if indicadores.get("macd"):
-        ema12 = data["Precio"].ewm(span=12, adjust=False).mean()
-        ema26 = data["Precio"].ewm(span=26, adjust=False).mean()
-        data["MACD"] = ema12 - ema26
-        data["Signal"] = data["MACD"].ewm(span=9, adjust=False).mean()
+        data["MACD"] = macd
+        data["Signal"] = signal
+        data["Hist"] = macd - signal
     return data
 
-def generar_recomendacion(data):
-    try:
-        p = data["Precio"].iloc[-1]
-        sma50 = data["SMA50"].iloc[-1]
-        sma200 = data["SMA200"].iloc[-1]
-        rsi = data["RSI"].iloc[-1]
-    except:
-        return "MANTENER", "hold", ["Faltan indicadores para generar una recomendación."]
-
-    condiciones = []
-    score = 0
-
-    if p > sma200 and sma50 > sma200:
-        condiciones.append("Tendencia alcista (Precio > SMA200 > SMA50)")
-        score += 1
-    elif p < sma200 and sma50 < sma200:
-        condiciones.append("Tendencia bajista (Precio < SMA200 < SMA50)")
-        score -= 1
-
-    if sma50 > sma200:
-        condiciones.append("Golden Cross (SMA50 > SMA200)")
-        score += 1
-    elif sma50 < sma200:
-        condiciones.append("Death Cross (SMA50 < SMA200)")
-        score -= 1
-
-    if rsi > 70:
-        condiciones.append("RSI alto (>70) - posible sobrecompra")
-        score -= 1
-    elif rsi < 30:
-        condiciones.append("RSI bajo (<30) - posible sobreventa")
-        score += 1
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def _to_csv_bytes(df_key, _df):
+    return _df.to_csv().encode("utf-8")
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def _to_parquet_bytes(df_key, _df):
+    buf = io.BytesIO()
+    pq.write_table(pa.Table.from_pandas(_df), buf, compression="zstd")
+    return buf.getvalue()
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def _to_excel_bytes(df_key, _df):
+    excel_buffer = io.BytesIO()
+    with pd.ExcelWriter(excel_buffer, engine="xlsxwriter") as writer:
+        # Las columnas son float32: sin formato, xlsxwriter las escribe como
+        # float64 con 16 dígitos (100.13 -> 100.129997253418)
+        _df.to_excel(writer, sheet_name="Datos", float_format="%.7g")
+    return excel_buffer.getvalue()
+
+def _build_rsi(data):
+    fig_rsi = go.Figure()
+    fig_rsi.add_trace(go.Scattergl(x=data.index, y=data["RSI"], name="RSI", line=dict(color="purple")))
+    fig_rsi.add_hline(y=70, line_dash="dash", line_color="red")
+    fig_rsi.add_hline(y=30, line_dash="dash", line_color="green")
+    fig_rsi.update_layout(height=300, margin=dict(t=30))
+    return fig_rsi
+
+def _build_macd(data):
+    hist = data["Hist"].to_numpy()
+    signs = (hist > 0).astype(np.int8)
+    fig_macd = go.Figure()
+    fig_macd.add_trace(go.Scattergl(x=data.index, y=data["MACD"], name="MACD", line=dict(color="blue")))
+    fig_macd.add_trace(go.Scattergl(x=data.index, y=data["Signal"], name="Signal", line=dict(color="orange")))
+    fig_macd.add_bar(x=data.index, y=hist,
+                     marker=dict(color=signs, colorscale=[[0, "#dc3545"], [1, "#28a745"]],
+                                 cmin=0, cmax=1, showscale=False))
+    fig_macd.update_layout(height=300, margin=dict(t=30))
+    return fig_macd
+
+def _build_vol(data):
+    fig_vol = go.Figure()
+    fig_vol.add_trace(go.Bar(x=data.index, y=data["Volumen"], name="Volumen", marker_color="gray"))
+    fig_vol.update_layout(height=300, margin=dict(t=30))
+    return fig_vol
+
+COLUMNAS_RECOMENDACION = ["Precio", "SMA50", "SMA200", "RSI"]
+
+def generar_recomendacion(last):
+    # `last` es la última fila de datos (data.iloc[-1])
+    columnas = COLUMNAS_RECOMENDACION
+    faltan = ["Faltan indicadores para generar una recomendación."]
+    if not set(columnas).issubset(last.index):
+        return "MANTENER", "hold", faltan
+    vals = last[columnas]
+    if vals.isna().any():
+        return "MANTENER", "hold", faltan
+    p, sma50, sma200, rsi = vals.to_numpy()
+
+    # Cada señal se evalúa una sola vez y alimenta tanto la lista como el score
+    alcista = p > sma200 and sma50 > sma200
+    bajista = p < sma200 and sma50 < sma200
+    golden_cross = sma50 > sma200
+    death_cross = sma50 < sma200
+    sobrecompra = rsi > 70
+    sobreventa = rsi < 30
+
+    senales = [
+        (alcista, "Tendencia alcista (Precio > SMA200 > SMA50)"),
+        (bajista, "Tendencia bajista (Precio < SMA200 < SMA50)"),
+        (golden_cross, "Golden Cross (SMA50 > SMA200)"),
+        (death_cross, "Death Cross (SMA50 < SMA200)"),
+        (sobrecompra, "RSI alto (>70) - posible sobrecompra"),
+        (sobreventa, "RSI bajo (<30) - posible sobreventa"),
+    ]
+    condiciones = [texto for activa, texto in senales if activa]
+
+    score = (
+        int(alcista) - int(bajista)
+        + int(golden_cross) - int(death_cross)
+        + int(sobreventa) - int(sobrecompra)
+    )
 
     if score >= 2:
         return "COMPRA", "buy", condiciones
@@ -98,49 +178,86 @@ def generar_recomendacion(data):
     else:
         return "MANTENER", "hold", condiciones
 
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def _recomendacion_html(clave, _last):
+    reco_texto, reco_tipo, condiciones = generar_recomendacion(_last)
+    items = "".join(f"<li>{html.escape(c)}</li>" for c in condiciones)
+    return reco_texto, reco_tipo, items
+
 # --- Sidebar ---
 st.sidebar.header("🔧 Configuración")
 
-ticker = st.sidebar.selectbox("Selecciona un activo:", [
-    "AAPL", "MSFT", "GOOGL", "TSLA", "AMZN", "META", "NVDA", "BTC-USD", "ETH-USD"
-], index=0)
-
 end_date = datetime.today()
-start_date = st.sidebar.date_input("Desde:", end_date - timedelta(days=365))
-indicadores = {
-    "sma": st.sidebar.checkbox("SMA 50/200", True),
-    "rsi": st.sidebar.checkbox("RSI (14)", True),
-    "macd": st.sidebar.checkbox("MACD", True),
-}
+
+# Un formulario evita que cada cambio en la barra lateral relance todo el
+# análisis: solo se recalcula al pulsar "Actualizar"
+with st.sidebar.form("config"):
+    ticker = st.selectbox("Selecciona un activo:", [
+        "AAPL", "MSFT", "GOOGL", "TSLA", "AMZN", "META", "NVDA", "BTC-USD", "ETH-USD"
+    ], index=0)
+
+    start_date = st.date_input("Desde:", end_date - timedelta(days=365))
+    indicadores = {
+        "sma": st.checkbox("SMA 50/200", True),
+        "rsi": st.checkbox("RSI (14)", True),
+        "macd": st.checkbox("MACD", True),
+        "volumen": st.checkbox("Volumen", True),
+    }
+    submitted = st.form_submit_button("Actualizar")
 
 # --- Carga de datos ---
-st.title(f"📊 Análisis técnico: {ticker}")
+if not submitted and "data" not in st.session_state:
+    st.title("📊 Análisis técnico")
+    st.info("Elige la configuración en la barra lateral y pulsa «Actualizar».")
+    st.stop()
 
-with st.spinner("Cargando datos..."):
-    df = safe_download(ticker, start_date, end_date)
+if submitted:
+    with st.spinner("Cargando datos..."):
+        df = safe_download(ticker, start_date, end_date)
 
-# --- Preparar datos ---
-price_col = next((c for c in ['Adj Close', 'Close'] if c in df.columns), None)
-if not price_col:
-    st.error("No se encontró columna de precios válida.")
-    st.stop()
+    # --- Preparar datos ---
+    price_col = "Close"
+    if price_col not in df.columns:
+        st.error("No se encontró columna de precios válida.")
+        st.stop()
 
-data = df[[price_col]].copy()
-data.columns = ["Precio"]
+    # calcular_indicadores ya trabaja sobre su propia copia
+    data = df[[price_col]].set_axis(["Precio"], axis=1)
 
-if "Volume" in df.columns:
-    data["Volumen"] = df["Volume"]
+    if "Volume" in df.columns and indicadores["volumen"]:
+        data["Volumen"] = df["Volume"]
 
-data = calcular_indicadores(data, indicadores)
+    data = calcular_indicadores(data, indicadores)
+    # Los indicadores se calculan en float64; para gráficos y exportación basta float32
+    data = data.astype({c: "float32" for c in data.select_dtypes("float64").columns})
+    st.session_state.update(data=data, ticker=ticker, indicadores=indicadores)
+else:
+    # Reruns sin envío (p. ej. botones de exportación) reutilizan el último análisis
+    data = st.session_state["data"]
+    ticker = st.session_state["ticker"]
+    indicadores = st.session_state["indicadores"]
+
+st.title(f"📊 Análisis técnico: {ticker}")
+
+# Huella rápida del DataFrame para no hashear todas las columnas
+df_key = (ticker, len(data), data.index[-1].value, tuple(data.columns))
+
+# Las primeras filas de cada indicador de ventana larga son NaN: cada
+# traza de indicador se recorta por su propio periodo de arranque, el
+# precio se dibuja completo (la exportación y la recomendación usan `data`)
+sma50_df = data.iloc[49:]
+sma200_df = data.iloc[199:]
+rsi_df = data.iloc[13:]
+macd_df = data.iloc[25:]
 
 # --- Gráfico de precios + SMA ---
 st.subheader("📈 Evolución de precios")
 
 fig = go.Figure()
-fig.add_trace(go.Scatter(x=data.index, y=data["Precio"], name="Precio", line=dict(color="blue")))
+fig.add_trace(go.Scattergl(x=data.index, y=data["Precio"], name="Precio", line=dict(color="blue")))
 if indicadores["sma"]:
-    fig.add_trace(go.Scatter(x=data.index, y=data["SMA50"], name="SMA 50", line=dict(color="orange")))
-    fig.add_trace(go.Scatter(x=data.index, y=data["SMA200"], name="SMA 200", line=dict(color="green")))
+    fig.add_trace(go.Scattergl(x=sma50_df.index, y=sma50_df["SMA50"], name="SMA 50", line=dict(color="orange")))
+    fig.add_trace(go.Scattergl(x=sma200_df.index, y=sma200_df["SMA200"], name="SMA 200", line=dict(color="green")))
 
 fig.update_layout(height=500, margin=dict(l=10, r=10, t=40, b=20), legend=dict(orientation="h"))
 st.plotly_chart(fig, use_container_width=True)
@@ -148,14 +265,16 @@ st.plotly_chart(fig, use_container_width=True)
 # --- Métricas clave ---
 st.subheader("📌 Métricas")
 
-precio_actual = data["Precio"].iloc[-1]
-variacion = ((precio_actual - data["Precio"].iloc[0]) / data["Precio"].iloc[0]) * 100
+last = data.iloc[-1]
+first_price = data["Precio"].iat[0]
+precio_actual = last["Precio"]
+variacion = ((precio_actual - first_price) / first_price) * 100
 
 col1, col2, col3 = st.columns(3)
 col1.metric("Precio actual", f"${precio_actual:.2f}", f"{variacion:.2f}%")
 if indicadores["sma"]:
-    col2.metric("SMA 50", f"${data['SMA50'].iloc[-1]:.2f}")
-    col3.metric("SMA 200", f"${data['SMA200'].iloc[-1]:.2f}")
+    col2.metric("SMA 50", f"${last['SMA50']:.2f}")
+    col3.metric("SMA 200", f"${last['SMA200']:.2f}")
 else:
     col2.metric("SMA 50", "—")
     col3.metric("SMA 200", "—")
@@ -168,43 +287,31 @@ tabs = st.tabs(["RSI", "MACD", "Volumen"])
 if indicadores["rsi"]:
     with tabs[0]:
         st.caption("RSI mide la fuerza relativa de las últimas subidas y bajadas de precio.")
-        fig_rsi = go.Figure()
-        fig_rsi.add_trace(go.Scatter(x=data.index, y=data["RSI"], name="RSI", line=dict(color="purple")))
-        fig_rsi.add_hline(y=70, line_dash="dash", line_color="red")
-        fig_rsi.add_hline(y=30, line_dash="dash", line_color="green")
-        fig_rsi.update_layout(height=300, margin=dict(t=30))
-        st.plotly_chart(fig_rsi, use_container_width=True)
+        st.plotly_chart(_build_rsi(rsi_df), use_container_width=True)
 
 if indicadores["macd"]:
     with tabs[1]:
         st.caption("MACD indica cambios en la fuerza, dirección y duración de la tendencia.")
-        fig_macd = go.Figure()
-        fig_macd.add_trace(go.Scatter(x=data.index, y=data["MACD"], name="MACD", line=dict(color="blue")))
-        fig_macd.add_trace(go.Scatter(x=data.index, y=data["Signal"], name="Signal", line=dict(color="orange")))
-        fig_macd.add_bar(x=data.index, y=data["MACD"] - data["Signal"],
-                         marker_color=["green" if v > 0 else "red" for v in data["MACD"] - data["Signal"]])
-        fig_macd.update_layout(height=300, margin=dict(t=30))
-        st.plotly_chart(fig_macd, use_container_width=True)
+        st.plotly_chart(_build_macd(macd_df), use_container_width=True)
 
 if "Volumen" in data.columns:
     with tabs[2]:
         st.caption("El volumen puede confirmar la dirección de la tendencia.")
-        fig_vol = go.Figure()
-        fig_vol.add_trace(go.Bar(x=data.index, y=data["Volumen"], name="Volumen", marker_color="gray"))
-        fig_vol.update_layout(height=300, margin=dict(t=30))
-        st.plotly_chart(fig_vol, use_container_width=True)
+        st.plotly_chart(_build_vol(data), use_container_width=True)
 
 # --- Recomendación automática ---
 st.subheader("🧠 Recomendación técnica")
 
-reco_texto, reco_tipo, condiciones = generar_recomendacion(data)
+# La clave incluye los valores que decide la recomendación (NaN si faltan)
+reco_clave = (ticker, last.name, tuple(last.reindex(COLUMNAS_RECOMENDACION).astype(float)))
+reco_texto, reco_tipo, reco_items = _recomendacion_html(reco_clave, last)
 reco_clase = {"buy": "buy", "sell": "sell", "hold": "hold"}[reco_tipo]
 
 st.markdown(f"""
 <div class="recommendation {reco_clase}">
 📌 <strong>{reco_texto}</strong>
 <ul>
-{''.join(f"<li>{c}</li>" for c in condiciones)}
+{reco_items}
 </ul>
 </div>
 """, unsafe_allow_html=True)
@@ -212,20 +319,29 @@ st.markdown(f"""
 # --- Exportación de datos ---
 st.subheader("📤 Exportar análisis")
 
-csv = data.to_csv().encode("utf-8")
-st.download_button("⬇️ Descargar CSV", data=csv, file_name=f"{ticker}_analisis.csv", mime="text/csv")
-
-excel_buffer = io.BytesIO()
-with pd.ExcelWriter(excel_buffer, engine="xlsxwriter") as writer:
-    data.to_excel(writer, sheet_name="Datos")
-    writer.close()
 st.download_button(
-    "⬇️ Descargar Excel",
-    data=excel_buffer.getvalue(),
-    file_name=f"{ticker}_analisis.xlsx",
-    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    "⬇️ Descargar Parquet",
+    data=_to_parquet_bytes(df_key, data),
+    file_name=f"{ticker}_analisis.parquet",
+    mime="application/vnd.apache.parquet"
 )
 
+# El contenido de un expander se ejecuta aunque esté cerrado, por eso el
+# CSV también se genera solo al pulsar el botón
+with st.expander("Otros formatos"):
+    if st.button("Generar CSV"):
+        st.download_button("⬇️ Descargar CSV", data=_to_csv_bytes(df_key, data),
+                           file_name=f"{ticker}_analisis.csv", mime="text/csv")
+
+# El Excel es la exportación más costosa: solo se genera bajo demanda
+if st.button("Generar Excel"):
+    st.download_button(
+        "⬇️ Descargar Excel",
+        data=_to_excel_bytes(df_key, data),
+        file_name=f"{ticker}_analisis.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
 # --- Nota legal ---
 st.markdown("---")
 st.caption("⚠️ Este análisis es con fines educativos. No constituye asesoría financiera.")
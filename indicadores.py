@@ -0,0 +1,130 @@
+# indicadores.py
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def _ewm_step(weighted, old_wt, cur, alpha):
+    # Un paso de ewm(adjust=False, ignore_na=False).mean() de pandas: un NaN
+    # mantiene el último valor y solo envejece el peso acumulado
+    if weighted != weighted:
+        if cur == cur:
+            weighted = cur
+        return weighted, old_wt
+    old_wt *= 1.0 - alpha
+    if cur == cur:
+        if weighted != cur:
+            weighted = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+        old_wt = 1.0
+    return weighted, old_wt
+
+
+def compute_all_indicators(prices):
+    # Una sola pasada lineal: SMA50/SMA200 con sumas móviles, RSI(14) con
+    # medias móviles de ganancias/pérdidas y EMAs recursivas para el MACD.
+    # Los NaN se tratan igual que en calcular_indicadores_pandas
+    n = prices.shape[0]
+    sma50 = np.full(n, np.nan)
+    sma200 = np.full(n, np.nan)
+    rsi = np.full(n, np.nan)
+    macd = np.full(n, np.nan)
+    signal = np.full(n, np.nan)
+
+    gains = np.zeros(n)
+    losses = np.zeros(n)
+    a12 = 2.0 / 13.0
+    a26 = 2.0 / 27.0
+    a9 = 2.0 / 10.0
+    sum50 = 0.0
+    cnt50 = 0
+    sum200 = 0.0
+    cnt200 = 0
+    sum_gain = 0.0
+    sum_loss = 0.0
+    ema12, wt12 = np.nan, 1.0
+    ema26, wt26 = np.nan, 1.0
+    sig, wt9 = np.nan, 1.0
+
+    for i in range(n):
+        p = prices[i]
+        valid = p == p
+
+        if valid:
+            sum50 += p
+            cnt50 += 1
+            sum200 += p
+            cnt200 += 1
+        if i >= 50:
+            q = prices[i - 50]
+            if q == q:
+                sum50 -= q
+                cnt50 -= 1
+        if i >= 200:
+            q = prices[i - 200]
+            if q == q:
+                sum200 -= q
+                cnt200 -= 1
+        if cnt50 == 50:
+            sma50[i] = sum50 / 50.0
+        if cnt200 == 200:
+            sma200[i] = sum200 / 200.0
+
+        # Como en pandas, un delta NaN cuenta como ganancia y pérdida nulas
+        if i > 0:
+            d = p - prices[i - 1]
+            if d > 0:
+                gains[i] = d
+            elif d < 0:
+                losses[i] = -d
+        sum_gain += gains[i]
+        sum_loss += losses[i]
+        if i >= 14:
+            sum_gain -= gains[i - 14]
+            sum_loss -= losses[i - 14]
+        if i >= 13:
+            if sum_loss > 0.0:
+                rsi[i] = 100.0 - 100.0 / (1.0 + sum_gain / sum_loss)
+            elif sum_gain > 0.0:
+                rsi[i] = 100.0
+
+        ema12, wt12 = _ewm_step(ema12, wt12, p, a12)
+        ema26, wt26 = _ewm_step(ema26, wt26, p, a26)
+        m = ema12 - ema26
+        macd[i] = m
+        sig, wt9 = _ewm_step(sig, wt9, m, a9)
+        signal[i] = sig
+
+    return sma50, sma200, rsi, macd, signal
+
+
+if numba is not None:
+    # Sin fastmath: el kernel depende de comparaciones con NaN
+    _ewm_step = numba.njit(cache=True)(_ewm_step)
+    compute_all_indicators = numba.njit(cache=True)(compute_all_indicators)
+
+
+def calcular_indicadores_pandas(data, indicadores):
+    # Solo se usa si numba no está instalado, así que las EMAs usan el motor
+    # por defecto de pandas (engine="numba" también requiere numba)
+    if indicadores.get("sma"):
+        data["SMA50"] = data["Precio"].rolling(50).mean()
+        data["SMA200"] = data["Precio"].rolling(200).mean()
+    if indicadores.get("rsi"):
+        delta = data["Precio"].diff()
+        gain = delta.where(delta > 0, 0.0)
+        loss = -delta.where(delta < 0, 0.0)
+        avg_gain = gain.rolling(14).mean()
+        avg_loss = loss.rolling(14).mean()
+        rs = avg_gain / avg_loss
+        data["RSI"] = 100 - (100 / (1 + rs))
+    if indicadores.get("macd"):
+        ema12 = data["Precio"].ewm(span=12, adjust=False).mean()
+        ema26 = data["Precio"].ewm(span=26, adjust=False).mean()
+        data["MACD"] = ema12 - ema26
+        data["Signal"] = data["MACD"].ewm(span=9, adjust=False).mean()
+        data["Hist"] = data["MACD"] - data["Signal"]
+    return data
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicadores import compute_all_indicators, calcular_indicadores_pandas
+
+COLUMNAS = ["SMA50", "SMA200", "RSI", "MACD", "Signal"]
+TODOS = {"sma": True, "rsi": True, "macd": True}
+
+
+def _precios(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return 100 + np.cumsum(rng.normal(size=n))
+
+
+def _comparar(prices):
+    data = pd.DataFrame({"Precio": prices}, index=pd.date_range("2020-01-01", periods=len(prices)))
+    esperado = calcular_indicadores_pandas(data.copy(), TODOS)
+    resultado = compute_all_indicators(np.asarray(prices, dtype=np.float64))
+    for nombre, valores in zip(COLUMNAS, resultado):
+        np.testing.assert_allclose(valores, esperado[nombre].to_numpy(), atol=1e-8, err_msg=nombre)
+
+
+@pytest.mark.parametrize("n", [0, 1, 5, 14, 50, 250, 5000])
+def test_kernel_coincide_con_pandas(n):
+    _comparar(_precios(n))
+
+
+@pytest.mark.parametrize("posiciones", [[100], [0], [0, 1, 2], [150, 151, 320], [399]])
+def test_kernel_coincide_con_pandas_con_nan(posiciones):
+    prices = _precios(400, seed=1)
+    prices[posiciones] = np.nan
+    _comparar(prices)